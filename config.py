@@ -10,7 +10,7 @@ API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 # Admin user IDs (comma-separated in .env file)
-ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
+ADMIN_IDS = frozenset(int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip())
 
 # Channel ID where approved posts will be sent
 TARGET_CHANNEL = os.getenv('TARGET_CHANNEL')
@@ -19,4 +19,10 @@ TARGET_CHANNEL = os.getenv('TARGET_CHANNEL')
 POST_TIMEOUT_HOURS = int(os.getenv('POST_TIMEOUT_HOURS', '24'))
 
 # Cooldown between posts in minutes (default: 30)
-POST_COOLDOWN_MINUTES = int(os.getenv('POST_COOLDOWN_MINUTES', '30'))
\ No newline at end of file
+POST_COOLDOWN_MINUTES = int(os.getenv('POST_COOLDOWN_MINUTES', '30'))
+
+# Redis connection URL for pending posts, cooldowns and cached entities
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Enable the /approve and /reject commands in addition to inline buttons
+ENABLE_LEGACY_COMMANDS = os.getenv('ENABLE_LEGACY_COMMANDS', 'false').lower() in ('1', 'true', 'yes')
\ No newline at end of file
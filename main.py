@@ -1,18 +1,28 @@
-from typing import Dict, Optional, Union, Tuple
+from typing import Awaitable, Callable, Dict, Optional, Set, Union, Tuple
 from telethon import TelegramClient, events, Button
 from telethon.tl.types import (
-    User, BotCommand, BotCommandScopeDefault, InputPeerChannel,
+    User, BotCommand, BotCommandScopeDefault, InputPeerChannel, InputPeerUser,
     MessageMediaPhoto, MessageMediaDocument
 )
 from telethon.tl.functions.bots import SetBotCommandsRequest
 from telethon.tl.custom import Message
+import redis.asyncio as aioredis
+import msgpack
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import re
+import time
+from dataclasses import asdict, dataclass
 from config import (
-    API_ID, API_HASH, BOT_TOKEN, ADMIN_IDS, TARGET_CHANNEL, POST_COOLDOWN_MINUTES
+    API_ID, API_HASH, BOT_TOKEN, ADMIN_IDS, TARGET_CHANNEL, POST_TIMEOUT_HOURS,
+    POST_COOLDOWN_MINUTES, REDIS_URL, ENABLE_LEGACY_COMMANDS
 )
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -23,82 +33,134 @@ logger = logging.getLogger(__name__)
 # Initialize the client
 client = TelegramClient('bot_session', API_ID, API_HASH)
 
-# Store pending posts, user entities, and cooldowns
-pending_posts: Dict[int, dict] = {}
-user_entities: Dict[int, User] = {}
-user_cooldowns: Dict[int, datetime] = {}
+# Pending posts, user entities, and cooldowns are kept in Redis
+redis_client = aioredis.from_url(REDIS_URL, decode_responses=False)
+
+# How long cached user entities are kept, in seconds
+USER_ENTITY_TTL = 3600
+
+@dataclass(slots=True)
+class PendingPost:
+    """A submitted post awaiting admin approval."""
+    user_id: int
+    chat_id: int
+    message_id: int
+    timestamp: float
+
+# Keep references to background tasks so they aren't garbage collected
+background_tasks: Set[asyncio.Task] = set()
+
+# Resolved target channel, cached for the lifetime of the process
+_channel_entity: Optional[Union[InputPeerChannel, User]] = None
+
+# Callback data of the approve/reject buttons
+APPROVE_DATA_RE = re.compile(rb'^approve_(\d+)$')
+REJECT_DATA_RE = re.compile(rb'^reject_(\d+)$')
+
+# Legacy /approve and /reject commands
+DECISION_COMMAND_RE = re.compile(r'^/(approve|reject)(?:@\w+)?\s+(\d+)', re.ASCII)
 
 # Allowed image MIME types
-ALLOWED_MIME_TYPES = {
+ALLOWED_MIME_TYPES = frozenset({
     'image/jpeg',
     'image/png',
     'image/gif',
     'image/webp'
-}
+})
 
 def is_image_file(message: Message) -> bool:
     """Check if the message contains an image file."""
-    if isinstance(message.media, MessageMediaPhoto):
+    media = message.media
+    media_type = type(media)
+    if media_type is MessageMediaPhoto:
         return True
     
-    if isinstance(message.media, MessageMediaDocument):
-        mime_type = message.media.document.mime_type
-        return mime_type in ALLOWED_MIME_TYPES
+    if media_type is MessageMediaDocument:
+        return media.document.mime_type in ALLOWED_MIME_TYPES
     
     return False
 
-async def setup_commands() -> None:
-    """Set up bot commands for all users."""
-    commands = [
-        BotCommand('start', 'Start the bot and get instructions'),
-        BotCommand('help', 'Show help message'),
+# Commands shown in the Telegram command menu
+BOT_COMMANDS = [
+    BotCommand('start', 'Start the bot and get instructions'),
+    BotCommand('help', 'Show help message')
+]
+if ENABLE_LEGACY_COMMANDS:
+    BOT_COMMANDS += [
         BotCommand('approve', 'Approve a post (admin only)'),
         BotCommand('reject', 'Reject a post (admin only)')
     ]
 
+async def setup_commands() -> None:
+    """Set up bot commands for all users."""
+    # An empty lang_code applies to users of every language
     await client(SetBotCommandsRequest(
         scope=BotCommandScopeDefault(),
-        lang_code='en',
-        commands=commands
+        lang_code='',
+        commands=BOT_COMMANDS
     ))
 
-async def get_user_entity(user_id: int) -> Optional[User]:
+async def cache_user_entity(user: User) -> None:
+    """Store a user's input peer in the cache."""
+    # Only the ID and access hash are needed to message a user
+    if user.access_hash is None:
+        return
+    await redis_client.set(
+        f"entity:{user.id}",
+        msgpack.packb((user.id, user.access_hash)),
+        ex=USER_ENTITY_TTL
+    )
+
+async def get_user_entity(user_id: int) -> Optional[Union[User, InputPeerUser]]:
     """Get user entity by ID with caching."""
     try:
-        if user_id in user_entities:
-            return user_entities[user_id]
+        cached = await redis_client.get(f"entity:{user_id}")
+        if cached is not None:
+            cached_id, access_hash = msgpack.unpackb(cached)
+            return InputPeerUser(cached_id, access_hash)
 
         entity = await client.get_entity(user_id)
         if entity:
-            user_entities[user_id] = entity
+            await cache_user_entity(entity)
             return entity
-    except Exception as e:
-        logger.error(f"Failed to get user entity {user_id}: {e}")
+    except Exception:
+        logger.error("Failed to get user entity %s", user_id, exc_info=True)
     return None
 
 async def get_channel_entity() -> Optional[Union[InputPeerChannel, User]]:
-    """Get the target channel entity."""
+    """Get the target channel entity, resolving it only once."""
+    global _channel_entity
+    if _channel_entity is not None:
+        return _channel_entity
+
     try:
         if TARGET_CHANNEL.startswith('@'):
-            return await client.get_entity(TARGET_CHANNEL)
+            _channel_entity = await client.get_entity(TARGET_CHANNEL)
+            return _channel_entity
         
         channel_id = int(TARGET_CHANNEL)
         try:
-            return await client.get_entity(channel_id)
+            _channel_entity = await client.get_entity(channel_id)
         except ValueError:
-            async for message in client.iter_messages(channel_id, limit=1):
-                return message.peer_id
-    except Exception as e:
-        logger.error(f"Failed to get channel entity: {e}")
+            messages = await client.get_messages(channel_id, limit=1)
+            if messages:
+                _channel_entity = messages[0].peer_id
+        return _channel_entity
+    except Exception:
+        logger.error("Failed to get channel entity", exc_info=True)
     return None
 
-async def send_to_channel(message: Message) -> bool:
-    """Send a message to the target channel without forwarding attribution."""
+async def send_to_channel(post: PendingPost) -> bool:
+    """Send a pending post to the target channel without forwarding attribution."""
     try:
         channel = await get_channel_entity()
         if not channel:
             return False
 
+        message = await client.get_messages(post.chat_id, ids=post.message_id)
+        if not message:
+            return False
+
         caption = "#предложка"
 
         if message.media:
@@ -110,8 +172,8 @@ async def send_to_channel(message: Message) -> bool:
         else:
             await client.send_message(channel, caption)
         return True
-    except Exception as e:
-        logger.error(f"Failed to send message to channel: {e}")
+    except Exception:
+        logger.error("Failed to send message to channel", exc_info=True)
         return False
 
 async def notify_user(user_id: int, message: str) -> None:
@@ -120,35 +182,116 @@ async def notify_user(user_id: int, message: str) -> None:
         user_entity = await get_user_entity(user_id)
         if user_entity:
             await client.send_message(user_entity, message)
-    except Exception as e:
-        logger.error(f"Failed to notify user {user_id}: {e}")
+    except Exception:
+        logger.error("Failed to notify user %s", user_id, exc_info=True)
 
-def can_user_post(user_id: int) -> Tuple[bool, Optional[timedelta]]:
-    """Check if a user can post based on cooldown."""
-    if user_id not in user_cooldowns:
-        return True, None
-    
-    cooldown_end = user_cooldowns[user_id]
-    now = datetime.now()
-    
-    if now >= cooldown_end:
+async def can_user_post(user_id: int) -> Tuple[bool, Optional[int]]:
+    """Check if a user can post based on cooldown.
+
+    Returns whether posting is allowed and, if not, the seconds remaining.
+    """
+    ttl = await redis_client.ttl(f"cooldown:{user_id}")
+    if ttl <= 0:
         return True, None
-    
-    remaining = cooldown_end - now
-    return False, remaining
+    return False, ttl
+
+async def set_user_cooldown(user_id: int) -> bool:
+    """Set cooldown for a user. Returns False if one is already active."""
+    return bool(await redis_client.set(
+        f"cooldown:{user_id}", "1", ex=POST_COOLDOWN_MINUTES * 60, nx=True
+    ))
+
+async def clear_user_cooldown(user_id: int) -> None:
+    """Remove the cooldown for a user."""
+    await redis_client.delete(f"cooldown:{user_id}")
+
+async def add_pending_post(message: Message) -> int:
+    """Store a post awaiting approval and return its ID."""
+    # INCR is atomic, so concurrent submissions never share an ID
+    post_id = await redis_client.incr("pending:counter")
+    post = PendingPost(
+        user_id=message.sender_id,
+        chat_id=message.chat_id,
+        message_id=message.id,
+        timestamp=time.time()
+    )
+
+    await store_pending_post(post_id, post)
+    return post_id
+
+async def store_pending_post(post_id: int, post: PendingPost) -> None:
+    """Write a pending post to Redis."""
+    # Posts nobody acts on expire POST_TIMEOUT_HOURS after submission
+    key = f"pending:{post_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping=asdict(post))
+        pipe.expireat(key, int(post.timestamp) + POST_TIMEOUT_HOURS * 3600)
+        await pipe.execute()
+
+async def claim_pending_post(post_id: int) -> Optional[PendingPost]:
+    """Atomically take a post out of the pending queue.
+
+    Returns None if the post doesn't exist or was already claimed, so only
+    one caller can act on a given post.
+    """
+    key = f"pending:{post_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hgetall(key)
+        pipe.delete(key)
+        data, deleted = await pipe.execute()
+
+    if not deleted:
+        return None
+
+    return PendingPost(
+        user_id=int(data[b'user_id']),
+        chat_id=int(data[b'chat_id']),
+        message_id=int(data[b'message_id']),
+        timestamp=float(data[b'timestamp'])
+    )
 
-def set_user_cooldown(user_id: int) -> None:
-    """Set cooldown for a user."""
-    user_cooldowns[user_id] = datetime.now() + timedelta(minutes=POST_COOLDOWN_MINUTES)
+async def notify_admin(
+    admin_id: int, post_id: int, user_id: int,
+    media: Union[MessageMediaPhoto, MessageMediaDocument]
+) -> None:
+    """Forward a pending post to an admin with approve/reject buttons."""
+    buttons = [
+        [
+            Button.inline("✅ Approve", f"approve_{post_id}"),
+            Button.inline("❌ Reject", f"reject_{post_id}")
+        ]
+    ]
+
+    try:
+        admin_entity = await get_user_entity(admin_id)
+        if admin_entity:
+            # Send the media, details and buttons together in a single request
+            await client.send_message(
+                admin_entity,
+                f"New post pending approval (ID: {post_id})\n"
+                f"From user: {user_id}",
+                file=media,
+                buttons=buttons
+            )
+    except Exception:
+        logger.error("Failed to forward to admin %s", admin_id, exc_info=True)
+
+async def notify_admins(
+    post_id: int, user_id: int,
+    media: Union[MessageMediaPhoto, MessageMediaDocument]
+) -> None:
+    """Notify all admins about a pending post concurrently."""
+    await asyncio.gather(
+        *(notify_admin(admin_id, post_id, user_id, media) for admin_id in ADMIN_IDS),
+        return_exceptions=True
+    )
 
-@client.on(events.NewMessage(pattern='/start'))
 async def start_handler(event: events.NewMessage.Event) -> None:
     """Handle the /start command."""
     await event.respond(
         "👋 Welcome! Send me an image and I'll forward it to the admins for approval."
     )
 
-@client.on(events.NewMessage(pattern='/help'))
 async def help_handler(event: events.NewMessage.Event) -> None:
     """Handle the /help command."""
     is_admin = event.sender_id in ADMIN_IDS
@@ -158,17 +301,18 @@ async def help_handler(event: events.NewMessage.Event) -> None:
         "/help - Show this help message\n"
     )
     
-    if is_admin:
+    if is_admin and ENABLE_LEGACY_COMMANDS:
         help_text += (
             "/approve <post_id> - Approve a post\n"
             "/reject <post_id> - Reject a post"
         )
+    elif is_admin:
+        help_text += "\nUse the buttons under each submitted post to approve or reject it."
     else:
         help_text += "\nSimply send an image to submit it for approval!"
     
     await event.respond(help_text)
 
-@client.on(events.NewMessage(func=lambda e: e.media is not None))
 async def media_handler(event: events.NewMessage.Event) -> None:
     """Handle incoming media messages."""
     if not isinstance(event.sender, User):
@@ -182,117 +326,151 @@ async def media_handler(event: events.NewMessage.Event) -> None:
         return
 
     # Check cooldown
-    can_post, remaining = can_user_post(event.sender_id)
+    can_post, remaining = await can_user_post(event.sender_id)
     if not can_post:
-        minutes = int(remaining.total_seconds() / 60)
+        minutes = remaining // 60
         await event.respond(
             f"⏳ Please wait {minutes} minutes before submitting another post."
         )
         return
 
-    user_entities[event.sender_id] = event.sender
-    post_id = len(pending_posts)
-    pending_posts[post_id] = {
-        'user_id': event.sender_id,
-        'message': event.message,
-        'timestamp': datetime.now()
-    }
+    await cache_user_entity(event.sender)
+
+    # Set cooldown; a concurrent submission may have claimed it first
+    if not await set_user_cooldown(event.sender_id):
+        await event.respond(
+            "⏳ Please wait before submitting another post."
+        )
+        return
 
-    # Set cooldown
-    set_user_cooldown(event.sender_id)
+    try:
+        post_id = await add_pending_post(event.message)
+    except Exception:
+        logger.error("Failed to store post from user %s", event.sender_id, exc_info=True)
+        # Give the cooldown back since nothing was submitted
+        await clear_user_cooldown(event.sender_id)
+        await event.respond(
+            "❌ Failed to submit your post. Please try again."
+        )
+        return
 
     await event.respond(
         "✅ Your post has been received and is pending approval by an admin."
     )
 
-    # Create approve/reject buttons
-    buttons = [
-        [
-            Button.inline("✅ Approve", f"approve_{post_id}"),
-            Button.inline("❌ Reject", f"reject_{post_id}")
-        ]
-    ]
-
-    for admin_id in ADMIN_IDS:
-        try:
-            admin_entity = await get_user_entity(admin_id)
-            if admin_entity:
-                await client.send_message(
-                    admin_entity,
-                    f"New post pending approval (ID: {post_id})\n"
-                    f"From user: {event.sender_id}",
-                    buttons=buttons
-                )
-                await client.forward_messages(admin_entity, event.message)
-        except Exception as e:
-            logger.error(f"Failed to forward to admin {admin_id}: {e}")
-
-@client.on(events.CallbackQuery(pattern=r"^approve_(\d+)$"))
-async def approve_callback(event: events.CallbackQuery.Event) -> None:
-    """Handle approve button callback."""
+    # Notify all admins concurrently without holding up this handler. Only the
+    # media is passed on so the task doesn't keep the whole event alive.
+    task = asyncio.create_task(
+        notify_admins(post_id, event.sender_id, event.message.media)
+    )
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def reply_to_admin(
+    event: Union[events.CallbackQuery.Event, events.NewMessage.Event], text: str
+) -> None:
+    """Reply to an admin with an alert for buttons or a message for commands."""
+    if isinstance(event, events.CallbackQuery.Event):
+        await event.answer(text, alert=True)
+    else:
+        await event.respond(text)
+
+async def handle_decision(
+    event: Union[events.CallbackQuery.Event, events.NewMessage.Event],
+    post_id: int,
+    approve: bool
+) -> None:
+    """Approve or reject a pending post on behalf of an admin."""
     if event.sender_id not in ADMIN_IDS:
-        await event.answer("❌ This action is only available to admins.", alert=True)
+        await reply_to_admin(event, "❌ This action is only available to admins.")
         return
 
     try:
-        post_id = int(event.pattern_match.group(1))
-        if post_id not in pending_posts:
-            await event.answer("❌ Invalid post ID!", alert=True)
+        post = await claim_pending_post(post_id)
+        if post is None:
+            await reply_to_admin(event, "❌ Invalid post ID or post already handled!")
             return
 
-        post = pending_posts[post_id]
-        if not await send_to_channel(post['message']):
-            await event.answer("❌ Failed to send to target channel!", alert=True)
-            return
+        if approve:
+            if not await send_to_channel(post):
+                # Put the post back so it can be approved again
+                await store_pending_post(post_id, post)
+                await reply_to_admin(event, "❌ Failed to send to target channel!")
+                return
 
-        await notify_user(post['user_id'], "✅ Your post has been approved and published!")
-        del pending_posts[post_id]
-        
-        # Update the message to show it was approved
-        await event.edit(
-            f"✅ Post {post_id} has been approved and published!",
-            buttons=None
+            await notify_user(post.user_id, "✅ Your post has been approved and published!")
+            status = f"✅ Post {post_id} has been approved and published!"
+        else:
+            await notify_user(post.user_id, "❌ Your post has been rejected.")
+            status = f"❌ Post {post_id} has been rejected."
+
+        if isinstance(event, events.CallbackQuery.Event):
+            # Update the message to show the decision
+            await event.edit(status, buttons=None)
+            await event.answer("Post approved!" if approve else "Post rejected!")
+        else:
+            await event.respond(status)
+
+    except Exception:
+        logger.error(
+            "Error while trying to %s post %s",
+            "approve" if approve else "reject", post_id, exc_info=True
         )
-        await event.answer("Post approved!")
+        await reply_to_admin(event, "❌ An error occurred!")
 
-    except Exception as e:
-        logger.error(f"Error in approve callback: {e}")
-        await event.answer("❌ An error occurred!", alert=True)
+@client.on(events.CallbackQuery(pattern=APPROVE_DATA_RE))
+async def approve_callback(event: events.CallbackQuery.Event) -> None:
+    """Handle approve button callback."""
+    await handle_decision(event, int(event.pattern_match.group(1)), approve=True)
 
-@client.on(events.CallbackQuery(pattern=r"^reject_(\d+)$"))
+@client.on(events.CallbackQuery(pattern=REJECT_DATA_RE))
 async def reject_callback(event: events.CallbackQuery.Event) -> None:
     """Handle reject button callback."""
-    if event.sender_id not in ADMIN_IDS:
-        await event.answer("❌ This action is only available to admins.", alert=True)
+    await handle_decision(event, int(event.pattern_match.group(1)), approve=False)
+
+async def decision_command_handler(event: events.NewMessage.Event) -> None:
+    """Handle the legacy /approve and /reject commands."""
+    match = DECISION_COMMAND_RE.match(event.raw_text)
+    if not match:
+        await event.respond("Usage: /approve <post_id> or /reject <post_id>")
         return
 
-    try:
-        post_id = int(event.pattern_match.group(1))
-        if post_id not in pending_posts:
-            await event.answer("❌ Invalid post ID!", alert=True)
-            return
+    await handle_decision(
+        event, int(match.group(2)), approve=match.group(1) == 'approve'
+    )
 
-        post = pending_posts[post_id]
-        await notify_user(post['user_id'], "❌ Your post has been rejected.")
-        del pending_posts[post_id]
-        
-        # Update the message to show it was rejected
-        await event.edit(
-            f"❌ Post {post_id} has been rejected.",
-            buttons=None
-        )
-        await event.answer("Post rejected!")
+COMMANDS: Dict[str, Callable[[events.NewMessage.Event], Awaitable[None]]] = {
+    '/start': start_handler,
+    '/help': help_handler
+}
+if ENABLE_LEGACY_COMMANDS:
+    COMMANDS['/approve'] = decision_command_handler
+    COMMANDS['/reject'] = decision_command_handler
+
+@client.on(events.NewMessage)
+async def message_handler(event: events.NewMessage.Event) -> None:
+    """Dispatch incoming messages to the command and media handlers."""
+    text = event.raw_text or ""
+    if text.startswith('/'):
+        # Strip arguments and a trailing @botname from the command
+        command = text.split(maxsplit=1)[0].split('@', 1)[0]
+        handler = COMMANDS.get(command)
+        if handler:
+            await handler(event)
+            return
 
-    except Exception as e:
-        logger.error(f"Error in reject callback: {e}")
-        await event.answer("❌ An error occurred!", alert=True)
+    if event.media is not None:
+        await media_handler(event)
 
 async def main() -> None:
     """Start the bot."""
     await client.start(bot_token=BOT_TOKEN)
-    await setup_commands()
+    # Independent requests, so run them concurrently
+    await asyncio.gather(setup_commands(), get_channel_entity())
     logger.info("Bot started!")
     await client.run_until_disconnected()
 
 if __name__ == '__main__':
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main()) 
\ No newline at end of file